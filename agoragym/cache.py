@@ -0,0 +1,330 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+from os import path
+
+import numpy as np
+
+from agoragym.version import VERSION
+
+"""
+    A persistent, content-addressed cache of simulation and analysis results.
+
+    A result is a dict of numpy arrays (or a single array) stored as a
+    compressed .npz file named by the hash of everything that determines it:
+    the configuration, the seed, the digests of the input files and the code
+    version.  Files are written atomically and the computation of a key is
+    serialized by a lock file of its own, so several processes can share one
+    cache directory.  The least recently used files are evicted when the running
+    total of the stored sizes exceeds the size budget.
+"""
+
+_ARRAY_KEY = "__array__"
+_digests = {}
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def _canonical(obj):
+    # A json form that keeps the types apart: dicts, tuples and sets are tagged, the
+    # items of dicts and sets are sorted by their own canonical json, and dict keys
+    # keep their type, so {1: 2} and {"1": 2} or (1,) and [1] do not collide.
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, list):
+        return [_canonical(item) for item in obj]
+    if isinstance(obj, tuple):
+        return {"__tuple__": [_canonical(item) for item in obj]}
+    if isinstance(obj, dict):
+        items = [[_canonical(key), _canonical(value)] for key, value in obj.items()]
+        return {"__dict__": sorted(items, key=lambda item: _dumps(item[0]))}
+    if isinstance(obj, (set, frozenset)):
+        return {"__set__": sorted((_canonical(item) for item in obj), key=_dumps)}
+    if isinstance(obj, np.ndarray):
+        return {"__ndarray__": obj.dtype.str, "shape": list(obj.shape), "data": obj.ravel().tolist()}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Cannot hash a value of type {}".format(type(obj).__name__))
+
+
+def stable_hash(obj):
+    '''
+    Returns the sha256 hex digest of a json-like object, independent of dict ordering.
+    Dict keys may be of any hashable json-like type, tuples and sets are told apart from
+    lists, and numpy arrays and scalars are accepted.
+    '''
+    return hashlib.sha256(_dumps(_canonical(obj)).encode("utf-8")).hexdigest()
+
+
+def file_digest(filename):
+    '''
+    Returns the sha256 hex digest of the content of a file, memoized by size and modification time.
+    '''
+    stat = os.stat(filename)
+    memo = (path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    if memo not in _digests:
+        h = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _digests[memo] = h.hexdigest()
+    return _digests[memo]
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    '''
+    Returns the package version and a digest of the agoragym sources, so that a change
+    of the simulation code invalidates the cached results.
+    '''
+    root = path.dirname(path.abspath(__file__))
+    h = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.endswith(".py"):
+                filename = path.join(dirpath, name)
+                h.update(path.relpath(filename, root).encode("utf-8"))
+                h.update(file_digest(filename).encode("utf-8"))
+    return "{}-{}".format(VERSION, h.hexdigest()[:16])
+
+
+@contextmanager
+def _locked(filename):
+    with open(filename, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _locked_once(filename):
+    # Like _locked, but the lock file is removed on release. A process that was waiting
+    # on the removed file finds it replaced or gone and locks the current one instead.
+    while True:
+        f = open(filename, "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            current = os.fstat(f.fileno()).st_ino == os.stat(filename).st_ino
+        except FileNotFoundError:
+            current = False
+        if current:
+            break
+        f.close()
+    try:
+        yield
+    finally:
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
+class ResultCache(object):
+    '''
+    An on-disk cache of results keyed by configuration, seed, input files and code version.
+
+    Parameters
+    ----------
+    directory: str
+        the cache directory, created if needed, it can be shared by concurrent processes
+    max_bytes: integer
+        the size budget of the cache, least recently used results are evicted beyond it
+    '''
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock_dir = path.join(directory, "locks")
+        self.size_file = path.join(directory, "size")
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, config, seed=None, inputs=(), version=None):
+        '''
+        Returns the key of a result.
+
+        Parameters
+        ----------
+        config: dict
+            the parameters of the computation, e.g. CrissCrossEnv.config()
+        seed: integer
+            the seed of the random number generator
+        inputs: list
+            the input files, hashed by content
+        version: str
+            the code version, default is code_version()
+        '''
+        return stable_hash({
+            "config": config,
+            "seed": seed,
+            "inputs": [file_digest(filename) for filename in inputs],
+            "version": version if version is not None else code_version(),
+        })
+
+    def _path(self, key):
+        return path.join(self.directory, key[:2], key + ".npz")
+
+    def _lock(self, key):
+        # One lock file per key, only while it is computed, so the lock files do not grow with the cache
+        lock_dir = path.join(self.lock_dir, key[:2])
+        os.makedirs(lock_dir, exist_ok=True)
+        return _locked_once(path.join(lock_dir, key + ".lock"))
+
+    def get(self, key):
+        '''
+        Returns the cached result of key, or None.
+        '''
+        filename = self._path(key)
+        try:
+            with np.load(filename, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(filename)  # the modification time orders the LRU eviction
+        except FileNotFoundError:
+            # Missing or evicted meanwhile
+            return None
+        except (EOFError, ValueError, zipfile.BadZipFile, zlib.error):
+            # Corrupt, remove it so that it is computed and stored again
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            return None
+        return self._result(arrays)
+
+    def _result(self, arrays):
+        if _ARRAY_KEY in arrays:
+            return arrays[_ARRAY_KEY]
+        return arrays
+
+    def put(self, key, result):
+        '''
+        Store a result, a dict of numpy arrays or a numpy array.
+        Object arrays are refused, they can only be stored pickled.
+
+        Returns
+        -------
+        the result as get() returns it, with every value converted to a numpy array
+        '''
+        arrays = result if isinstance(result, dict) else {_ARRAY_KEY: result}
+        arrays = {name: np.asarray(array) for name, array in arrays.items()}
+        for name, array in arrays.items():
+            if array.dtype.hasobject:
+                raise TypeError("Cannot cache the object array {}".format(name))
+        filename = self._path(key)
+        os.makedirs(path.dirname(filename), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.dirname(filename), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, filename)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._add_size(os.stat(filename).st_size)
+        return self._result(arrays)
+
+    def get_or_compute(self, fn, config, seed=None, inputs=(), version=None):
+        '''
+        Returns the cached result of fn(config, seed), computing and storing it if missing.
+        Concurrent processes asking for the same missing result compute it only once.
+        '''
+        key = self.key(config, seed, inputs, version)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        with self._lock(key):
+            # Another process may have computed it while we were waiting
+            result = self.get(key)
+            if result is not None:
+                self.hits += 1
+                return result
+            self.misses += 1
+            return self.put(key, fn(config, seed))
+
+    def sweep(self, fn, configs, seeds=(None,), inputs=(), version=None):
+        '''
+        Run fn over every configuration and seed, reusing the cached points.
+
+        Returns
+        -------
+        a list of the results of every configuration, each a list of the results of every seed
+        '''
+        return [[self.get_or_compute(fn, config, seed, inputs, version) for seed in seeds] for config in configs]
+
+    def _entries(self):
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                if not name.endswith(".npz"):
+                    continue
+                filename = path.join(dirpath, name)
+                try:
+                    stat = os.stat(filename)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, filename))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _read_size(self):
+        try:
+            with open(self.size_file) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_size(self, total):
+        tmp = self.size_file + ".tmp.{}".format(os.getpid())
+        with open(tmp, "w") as f:
+            f.write(str(total))
+        os.replace(tmp, self.size_file)
+
+    def _add_size(self, size):
+        # The running total is shared by the processes, the tree is only scanned to evict
+        with _locked(path.join(self.lock_dir, "size.lock")):
+            total = self._read_size()
+            if total is not None:
+                total += size
+                if total <= self.max_bytes:
+                    self._write_size(total)
+                    return
+            self._evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used results until the cache fits in max_bytes.
+        '''
+        with _locked(path.join(self.lock_dir, "size.lock")):
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._write_size(total)
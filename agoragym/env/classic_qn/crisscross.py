@@ -110,6 +110,12 @@ class CrissCrossEnv(Env):
         self.sim.run(until=self.server1_monitor.step_ends)
         self.clock = self.sim.now
 
+    def config(self):
+        '''
+        Returns the parameters that determine an episode, e.g. to key cached evaluations.
+        '''
+        return {"Lambda": self.Lambda, "Mu": self.Mu, "time_unit": self.time_unit, "elapse": self.elapse}
+
     def _set_logdir(self, abs_path):
         '''
         abs_path is the absolute path of '.../logs/'
@@ -170,13 +170,13 @@ class SwitchPort(object):
         self.flow = {flowids[i]: i for i in range(self.num_flow)}
         self.flowids = flowids
         self.queue = [Store(sim) for i in range(self.num_flow)]
-        self.qlmit = qlimit
+        self.qlimit = qlimit
         self.limit_bytes = limit_bytes
         self.busy = 0  # a flag to track if a packet is currently being sent
-        self.qsize = np.zeros(self.num_flow, dtype=np.int)  # current size of the queue in bytes/packets
+        self.qsize = np.zeros(self.num_flow, dtype=int)  # current size of the queue in bytes/packets
         self.out = None  # set the "out" to the entity to receive the packet
         self.weight = np.ones(self.num_flow) / self.num_flow  # effort to process different classes of jobs
-        self.probs = [sum(self.weight[0:i + 1]) for i in self.num_flow]  # cdf
+        self.probs = [sum(self.weight[0:i + 1]) for i in range(self.num_flow)]  # cdf
         self.action = sim.process(self.run())  # start the run() method as a SimPy process
         self.drop = 0
 
@@ -194,7 +194,7 @@ class SwitchPort(object):
         assert (weight.shape[0] == self.num_flow)
         assert (weight.sum() <= 1)
         self.weight = weight
-        self.probs = [sum(self.weight[0:i + 1]) for i in self.num_flow]
+        self.probs = [sum(self.weight[0:i + 1]) for i in range(self.num_flow)]
 
     def run(self):
         while True:
@@ -0,0 +1,293 @@
+from math import log, exp, sqrt
+
+import numpy as np
+from simpy import Environment
+
+from agoragym.env.component import Job, JobGenerator, SwitchPort, JobSink
+from agoragym.env.utils import RNG
+
+"""
+    Rare-event simulation of buffer overflow at a SwitchPort.
+
+    The estimated quantity is the probability that a single class port with
+    Poisson arrivals and exponential service drops a job (SwitchPort.drop,
+    qlimit in jobs) during a busy cycle: the cycle starts when a job arrives at
+    the empty port and ends when the port is empty again.
+
+    Two variance reduction methods are provided:
+        importance_sampling: exponentially tilted arrival/service rates with
+            path likelihood ratio weighting.
+        fixed_effort_splitting: multilevel splitting over queue occupancy thresholds.
+    Without a tilt, importance_sampling is the brute-force estimator, which gives
+    the baseline to compare the number of simulated events with.
+"""
+
+
+class LikelihoodRatio(object):
+    '''
+    The log likelihood ratio of the nominal over the sampling measure, computed on the
+    simulated path: the density ratio of every completed interarrival and service time,
+    and the survival ratio of the elapsed part of the pending ones.  Drawn variates that
+    are never observed (sizes of dropped or still waiting jobs) do not contribute.
+    All the variates of the run are drawn with the tilted rates.
+
+    Parameters
+    ----------
+    arrival_rate, service_rate: float
+        the nominal rates
+    tilted_arrival_rate, tilted_service_rate: float
+        the rates of the sampling measure
+    '''
+
+    def __init__(self, arrival_rate, service_rate, tilted_arrival_rate, tilted_service_rate):
+        self.log = 0.0
+        self.arrival_log = log(arrival_rate / tilted_arrival_rate)
+        self.service_log = log(service_rate / tilted_service_rate)
+        self.arrival_shift = arrival_rate - tilted_arrival_rate
+        self.service_shift = service_rate - tilted_service_rate
+
+    def elapse(self, dt, service):
+        # Survival ratio of the arrival clock, and of the service clock if a job is in service
+        self.log -= self.arrival_shift * dt
+        if service:
+            self.log -= self.service_shift * dt
+
+    def arrival(self):
+        self.log += self.arrival_log
+
+    def departure(self):
+        self.log += self.service_log
+
+    @property
+    def value(self):
+        return exp(self.log)
+
+
+class TiltedExponential(object):
+    '''
+    A no parameter function that returns exponential variates sampled with the tilted rate.
+    Their likelihood ratio is accounted on the path by LikelihoodRatio.
+
+    Parameters
+    ----------
+    rng: numpy.random.Generator
+        the random number generator
+    tilted_rate: float
+        the rate under the sampling measure
+    '''
+
+    def __init__(self, rng, tilted_rate):
+        self.rng = rng
+        self.tilted_rate = tilted_rate
+
+    def __call__(self):
+        return self.rng.exponential(1.0 / self.tilted_rate)
+
+
+class RareEventEstimate(object):
+    '''
+    The result of a rare-event estimator.
+
+    Parameters
+    ----------
+    estimate: float
+        the point estimate
+    variance: float
+        the estimated variance of the estimate
+    events: integer
+        the number of simulation events processed to get the estimate
+    '''
+
+    def __init__(self, estimate, variance, events):
+        self.estimate = estimate
+        self.variance = variance
+        self.events = events
+
+    @property
+    def relative_error(self):
+        if self.estimate <= 0:
+            return float("inf")
+        return sqrt(max(self.variance, 0.0)) / self.estimate
+
+    def __repr__(self):
+        return "estimate: {}, relative error: {}, events: {}". \
+            format(self.estimate, self.relative_error, self.events)
+
+
+def mm1_overflow_probability(arrival_rate, service_rate, qlimit):
+    '''
+    The exact overflow probability of a busy cycle for the M/M/1/qlimit port,
+    a reference to check the estimators against.
+    '''
+    # Gambler's ruin from 1 job: an arrival at qlimit jobs is dropped, as if it reached qlimit + 1
+    r = service_rate / arrival_rate
+    if r == 1.0:
+        return 1.0 / (qlimit + 1)
+    return (1.0 - r) / (1.0 - r ** (qlimit + 1))
+
+
+class _Cycle(object):
+    '''
+    A single class SwitchPort fed by a JobGenerator and drained into a JobSink,
+    started with initial jobs in the port.
+    If lr is given, it is updated with the path of every step.
+    '''
+
+    def __init__(self, adist, sdist, qlimit, initial=1, lr=None):
+        self.sim = Environment()
+        self.lr = lr
+        self.port = SwitchPort(self.sim, [1.0], flowids=[0], qlimit=qlimit, limit_bytes=False)
+        self.sink = JobSink(self.sim)
+        self.generator = JobGenerator(self.sim, "Arrivals", adist, sdist, flowid=0)
+        self.generator.out = self.port
+        self.port.out = self.sink
+        for i in range(initial):
+            self.port.put(Job(self.sim.now, sdist(), -i, flowid=0))
+        self.events = 0
+
+    def occupancy(self):
+        return self.port.qsize.sum() + self.port.busy
+
+    def step(self):
+        now = self.sim.now
+        sent = self.generator.sent
+        received = self.sink.jobs_rec
+        serving = self.port.busy
+        self.sim.step()
+        self.events += 1
+        if self.lr is None:
+            return
+        self.lr.elapse(self.sim.now - now, serving)
+        if self.generator.sent > sent:
+            self.lr.arrival()
+        if self.sink.jobs_rec > received:
+            self.lr.departure()
+
+
+def importance_sampling(arrival_rate, service_rate, qlimit, cycles=10000, tilted_arrival_rate=None,
+                        tilted_service_rate=None, seed=None):
+    '''
+    Estimate the overflow probability of a busy cycle by importance sampling.
+
+    Arrivals and services are sampled with the tilted rates, and a cycle stops at the
+    first drop or when the port is empty. Each cycle is weighted by the likelihood ratio
+    of its path. The default tilt swaps the arrival and service rates: the likelihood
+    ratio of a path reaching the drop is then (arrival_rate/service_rate)^qlimit, which
+    bounds the relative error of the M/M/1 overflow estimate as qlimit grows. Pass the
+    nominal rates to get the brute-force estimator.
+
+    Parameters
+    ----------
+    arrival_rate, service_rate: float
+        the nominal rates, arrival_rate < service_rate
+    qlimit: integer
+        the buffer limit of the SwitchPort in jobs
+    cycles: integer
+        the number of simulated busy cycles, at least 2
+    tilted_arrival_rate, tilted_service_rate: float
+        the rates of the sampling measure
+    seed: integer
+        the seed of the random number generator
+
+    Returns
+    -------
+    a RareEventEstimate
+    '''
+    assert (arrival_rate < service_rate)
+    assert (qlimit >= 2)
+    assert (cycles >= 2)
+    if tilted_arrival_rate is None:
+        tilted_arrival_rate = service_rate
+    if tilted_service_rate is None:
+        tilted_service_rate = arrival_rate
+    rng, _ = RNG(seed)
+    adist = TiltedExponential(rng, tilted_arrival_rate)
+    sdist = TiltedExponential(rng, tilted_service_rate)
+
+    overflows = np.zeros(cycles)
+    events = 0
+    for k in range(cycles):
+        lr = LikelihoodRatio(arrival_rate, service_rate, tilted_arrival_rate, tilted_service_rate)
+        cycle = _Cycle(adist, sdist, qlimit, lr=lr)
+        while cycle.occupancy() > 0 and cycle.port.drop == 0:
+            cycle.step()
+        if cycle.port.drop > 0:
+            overflows[k] = lr.value
+        events += cycle.events
+
+    return RareEventEstimate(overflows.mean(), np.var(overflows, ddof=1) / cycles, events)
+
+
+def fixed_effort_splitting(arrival_rate, service_rate, qlimit, levels=None, effort=1000, seed=None):
+    '''
+    Estimate the overflow probability of a busy cycle by fixed-effort multilevel splitting.
+
+    The occupancy of the port (jobs in the queue and in service) is split by the increasing
+    levels. At each stage, effort runs start from the previous level and end when the port
+    reaches the next level (success) or empties (failure); the last stage succeeds on a drop.
+    The estimate is the product of the stage success frequencies.
+    As arrivals and services are exponential, the state entering a level is fully described
+    by the occupancy, so every run of a stage restarts from a port filled with that many jobs.
+
+    Parameters
+    ----------
+    arrival_rate, service_rate: float
+        the nominal rates, arrival_rate < service_rate
+    qlimit: integer
+        the buffer limit of the SwitchPort in jobs
+    levels: list
+        increasing occupancy thresholds in (1, qlimit), default is every occupancy
+    effort: integer
+        the number of runs per stage
+    seed: integer
+        the seed of the random number generator
+
+    Returns
+    -------
+    a RareEventEstimate
+    '''
+    assert (arrival_rate < service_rate)
+    assert (qlimit >= 2)
+    if levels is None:
+        levels = list(range(2, qlimit))
+    # A port filled with qlimit jobs would drop the last one, so the last stage starts below
+    assert (all(1 < level < qlimit for level in levels))
+    assert (all(a < b for a, b in zip(levels, levels[1:])))
+    rng, _ = RNG(seed)
+
+    def adist():
+        return rng.exponential(1.0 / arrival_rate)
+
+    def sdist():
+        return rng.exponential(1.0 / service_rate)
+
+    starts = [1] + list(levels)
+    targets = list(levels) + [None]  # None is the overflow
+    probs = []
+    events = 0
+    for start, target in zip(starts, targets):
+        successes = 0
+        for i in range(effort):
+            cycle = _Cycle(adist, sdist, qlimit, initial=start)
+            while True:
+                cycle.step()
+                if target is None and cycle.port.drop > 0:
+                    successes += 1
+                    break
+                occupancy = cycle.occupancy()
+                if target is not None and occupancy >= target:
+                    successes += 1
+                    break
+                if occupancy == 0:
+                    break
+            events += cycle.events
+        p = successes / effort
+        probs.append(p)
+        if p == 0:
+            break
+
+    probs = np.array(probs)
+    estimate = probs.prod() if len(probs) == len(starts) else 0.0
+    # The stages are independent, the estimate is a product of independent binomial frequencies
+    variance = np.prod(probs ** 2 + probs * (1 - probs) / effort) - estimate ** 2
+    return RareEventEstimate(estimate, variance, events)
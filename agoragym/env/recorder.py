@@ -0,0 +1,347 @@
+import json
+import os
+from os import path
+
+import numpy as np
+from gym import Wrapper
+
+"""
+    Trajectory recording for offline RL datasets.
+
+    Every recorded field is a raw binary file of fixed-size rows that is
+    memory-mapped, preallocated and grown chunk by chunk.  A small json
+    file ("meta.json") describes dtypes, row shapes, the number of valid
+    rows and the episode boundaries, so that readers in other processes
+    can memory-map the files read-only without loading them.
+"""
+
+META_FILE = "meta.json"
+
+
+def _write_json(filename, obj):
+    # Write to a temporary file and rename, so that readers never see a partial file.
+    tmp = filename + ".tmp.{}".format(os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, filename)
+
+
+class MemmapColumn(object):
+    '''
+    A growable column of fixed-size rows stored in a memory-mapped file.
+
+    Parameters
+    ----------
+    filename: str
+        the file that backs the column
+    dtype: numpy dtype
+        the type of the elements
+    shape: tuple
+        the shape of one row, () for scalars
+    chunk_size: integer
+        the number of rows allocated every time the column runs out of space
+    '''
+
+    def __init__(self, filename, dtype, shape=(), chunk_size=4096):
+        assert (chunk_size > 0)
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.chunk_size = chunk_size
+        self.row_bytes = self.dtype.itemsize * int(np.prod(self.shape, dtype=np.int64))
+        self.length = 0
+        self.capacity = 0
+        self.data = None
+        open(self.filename, "wb").close()
+        self._grow(chunk_size)
+
+    def _grow(self, min_capacity):
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity += self.chunk_size
+        if self.data is not None:
+            self.data.flush()
+            del self.data
+        with open(self.filename, "r+b") as f:
+            f.truncate(capacity * self.row_bytes)
+        self.data = np.memmap(self.filename, dtype=self.dtype, mode="r+", shape=(capacity,) + self.shape)
+        self.capacity = capacity
+
+    def append(self, rows):
+        '''
+        Append rows, an array like of shape (n,) + shape, and return the index of the first one.
+        '''
+        rows = np.asarray(rows, dtype=self.dtype).reshape((-1,) + self.shape)
+        start = self.length
+        end = start + rows.shape[0]
+        if end > self.capacity:
+            self._grow(end)
+        self.data[start:end] = rows
+        self.length = end
+        return start
+
+    def flush(self):
+        self.data.flush()
+
+    def close(self):
+        if self.data is not None:
+            self.data.flush()
+            del self.data
+            self.data = None
+        # Drop the unused preallocated tail
+        with open(self.filename, "r+b") as f:
+            f.truncate(self.length * self.row_bytes)
+        self.capacity = self.length
+
+    def describe(self):
+        return {"file": path.basename(self.filename), "dtype": self.dtype.str,
+                "shape": list(self.shape), "length": self.length}
+
+
+class TrajectoryRecorder(Wrapper):
+    '''
+    A gym wrapper that records the observations, actions, rewards and dones of the
+    wrapped environment into memory-mapped files under a directory.
+
+    Observations are the dicts {flowid: queue size} returned by the servers, they are
+    flattened in the order of obs_keys.  A missing action (None) is recorded as NaN.
+    The end step index (exclusive) of every finished episode is kept in the
+    episode_ends column.
+
+    If sinks is given, the waits recorded by the JobSink objects since the previous
+    step are stored per step as well.  As CrissCrossEnv resets itself when an episode
+    ends, the waits collected during that internal reset are attributed to the first
+    recorded step of the next episode.
+
+    Parameters
+    ----------
+    env: gym.Env
+        the environment to record
+    directory: str
+        the directory where the dataset is written, created if needed, it must be empty
+    obs_keys: list
+        the observation keys, default is the sorted keys of the first observation
+    action_dim: integer
+        the length of an action, default is env.Mu.shape[0]
+    sinks: list
+        names of the JobSink attributes of env to record waits from, e.g. ["sink1", "sink2"]
+    chunk_size: integer
+        the number of rows preallocated each time a file grows
+    flush_every: integer
+        steps between two flushes of the metadata, readers only see flushed steps
+    '''
+
+    def __init__(self, env, directory, obs_keys=None, action_dim=None, sinks=None, chunk_size=4096,
+                 flush_every=1024):
+        super(TrajectoryRecorder, self).__init__(env)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        if os.listdir(directory):
+            # Truncating the files of an existing dataset would corrupt it under its readers
+            raise FileExistsError("Trajectory directory is not empty: {}".format(directory))
+        self.obs_keys = list(obs_keys) if obs_keys is not None else None
+        self.action_dim = action_dim if action_dim is not None else env.Mu.shape[0]
+        self.sink_names = list(sinks) if sinks else []
+        self.chunk_size = chunk_size
+        self.flush_every = flush_every
+        self.columns = None
+        self.episode_start = 0
+        self.steps = 0
+        self._sinks = {}
+        self._sink_seen = {}
+        self._bind_sinks(from_start=False)
+
+    def _column(self, name, dtype, shape=()):
+        return MemmapColumn(path.join(self.directory, name + ".bin"), dtype, shape, self.chunk_size)
+
+    def _create_columns(self, observation):
+        if self.obs_keys is None:
+            self.obs_keys = sorted(observation.keys())
+        self.columns = {
+            "observations": self._column("observations", np.float64, (len(self.obs_keys),)),
+            "actions": self._column("actions", np.float64, (self.action_dim,)),
+            "rewards": self._column("rewards", np.float64),
+            "dones": self._column("dones", np.bool_),
+            "episode_ends": self._column("episode_ends", np.int64),
+        }
+        for name in self.sink_names:
+            self.columns[name + "_waits"] = self._column(name + "_waits", np.float64)
+            self.columns[name + "_offsets"] = self._column(name + "_offsets", np.int64)
+
+    def _bind_sinks(self, from_start):
+        for name in self.sink_names:
+            sink = getattr(self.env, name)
+            if self._sinks.get(name) is not sink:
+                self._sinks[name] = sink
+                self._sink_seen[name] = 0 if from_start else len(sink.waits)
+
+    def _flatten(self, observation):
+        return np.array([observation.get(key, 0) for key in self.obs_keys], dtype=np.float64)
+
+    def reset(self, **kwargs):
+        observation = self.env.reset(**kwargs)
+        if self.steps > self.episode_start:
+            self._end_episode()
+        self._bind_sinks(from_start=True)
+        return observation
+
+    def step(self, action=None):
+        observation, reward, done, info = self.env.step(action)
+        if self.columns is None:
+            self._create_columns(observation)
+
+        columns = self.columns
+        columns["observations"].append(self._flatten(observation))
+        if action is None:
+            columns["actions"].append(np.full(self.action_dim, np.nan))
+        else:
+            columns["actions"].append(action)
+        columns["rewards"].append(reward)
+        columns["dones"].append(done)
+        for name in self.sink_names:
+            # Read from the sink we held before the step, env may have replaced it on reset
+            waits = self._sinks[name].waits
+            offset = columns[name + "_waits"].append(waits[self._sink_seen[name]:])
+            columns[name + "_offsets"].append(offset)
+            self._sink_seen[name] = len(waits)
+        self.steps += 1
+
+        if done:
+            self._end_episode()
+            self._bind_sinks(from_start=True)
+        if self.steps % self.flush_every == 0:
+            self.flush()
+        return observation, reward, done, info
+
+    def _end_episode(self):
+        self.columns["episode_ends"].append(self.steps)
+        self.episode_start = self.steps
+
+    def describe(self):
+        columns = self.columns or {}
+        return {
+            "steps": self.steps,
+            "obs_keys": self.obs_keys,
+            "sinks": self.sink_names,
+            "columns": {name: column.describe() for name, column in columns.items()},
+        }
+
+    def flush(self):
+        '''
+        Flush the data and publish the steps recorded so far to readers.
+        '''
+        if self.columns is None:
+            return
+        for column in self.columns.values():
+            column.flush()
+        _write_json(path.join(self.directory, META_FILE), self.describe())
+
+    def close(self):
+        if self.columns is not None:
+            if self.steps > self.episode_start:
+                self._end_episode()
+            for column in self.columns.values():
+                column.close()
+            _write_json(path.join(self.directory, META_FILE), self.describe())
+        return self.env.close()
+
+
+class TrajectoryDataset(object):
+    '''
+    Read-only access to a dataset written by TrajectoryRecorder.
+
+    The files are memory-mapped, so any number of processes can open the same dataset
+    without loading it; only the rows that are indexed are read from disk.  The dataset
+    sees the steps published by the last flush of the recorder, call refresh() to pick
+    up newer ones.
+
+    Parameters
+    ----------
+    directory: str
+        the directory of the dataset
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.refresh()
+
+    def refresh(self):
+        with open(path.join(self.directory, META_FILE)) as f:
+            meta = json.load(f)
+        self.steps = meta["steps"]
+        self.obs_keys = meta["obs_keys"]
+        self.sink_names = meta["sinks"]
+        self.columns = {}
+        for name, desc in meta["columns"].items():
+            length = desc["length"]
+            if length == 0:
+                self.columns[name] = np.empty((0,) + tuple(desc["shape"]), dtype=desc["dtype"])
+                continue
+            self.columns[name] = np.memmap(path.join(self.directory, desc["file"]), dtype=desc["dtype"],
+                                           mode="r", shape=(length,) + tuple(desc["shape"]))
+
+    def __len__(self):
+        return self.steps
+
+    @property
+    def num_episodes(self):
+        return self.columns["episode_ends"].shape[0]
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def episode(self, i):
+        '''
+        Returns a dict of read-only views on the steps of episode i.
+        '''
+        ends = self.columns["episode_ends"]
+        start = ends[i - 1] if i > 0 else 0
+        end = ends[i]
+        return {name: self.columns[name][start:end] for name in ("observations", "actions", "rewards", "dones")}
+
+    def sink_waits(self, name, i):
+        '''
+        Returns a read-only view on the waits recorded by sink name at step i.
+        '''
+        offsets = self.columns[name + "_offsets"]
+        waits = self.columns[name + "_waits"]
+        start = offsets[i]
+        end = offsets[i + 1] if i + 1 < self.steps else waits.shape[0]
+        return waits[start:end]
+
+    def sample(self, batch_size, rng=None):
+        '''
+        Sample a minibatch of transitions uniformly.
+
+        Parameters
+        ----------
+        batch_size: integer
+            the number of transitions
+        rng: numpy.random.Generator
+            the random number generator, see agoragym.env.utils.RNG
+
+        Returns
+        -------
+        a dict with observations, actions, rewards, dones and next_observations;
+        next_observations of the last step of an episode is its own observation.
+        '''
+        assert (self.steps > 0)
+        if rng is None:
+            rng = np.random.default_rng()
+        idx = np.sort(rng.integers(0, self.steps, size=batch_size))
+        observations = self.columns["observations"]
+        dones = self.columns["dones"][idx]
+        # Only the sampled rows are copied out of the memory maps
+        next_idx = np.where(dones | (idx + 1 >= self.steps), idx, idx + 1)
+        ends = self.columns["episode_ends"]
+        if ends.shape[0] > 0:
+            # The ends are sorted, a binary search finds whether idx + 1 is one of them
+            pos = np.minimum(np.searchsorted(ends, idx + 1), ends.shape[0] - 1)
+            next_idx = np.where(ends[pos] == idx + 1, idx, next_idx)
+        return {
+            "observations": observations[idx],
+            "actions": self.columns["actions"][idx],
+            "rewards": self.columns["rewards"][idx],
+            "dones": dones,
+            "next_observations": observations[next_idx],
+        }
@@ -7,6 +7,8 @@ import pandas as pd
 import re
 import simpy
 
+from agoragym.cache import ResultCache
+
 media_log = "eth0_audience_video4.csv"
 rexfer_log = "eth0_video4_arq_res.csv"
 request_log = "eth0_video_rex_req_v3.csv"
@@ -70,14 +72,26 @@ def transform_rexfer_df(this_df):
     new_df = this_df[["Time", "Protocol", "seq"]]
     return new_df
 
-df_rex = transform_rexfer_df(rexfer_df)
-df_req = transform_request_df(request_df)
-
-df_combined = pd.concat([df_req, df_rex], ignore_index=True)
-df_combined.sort_values(
-    by=["Time", "seq"], axis=0, ascending=[True, True], inplace=True
-)
-df_combined.reset_index(drop=True, inplace=True)
+def combine(config, seed):
+    df_rex = transform_rexfer_df(rexfer_df)
+    df_req = transform_request_df(request_df)
+
+    df_combined = pd.concat([df_req, df_rex], ignore_index=True)
+    df_combined.sort_values(
+        by=["Time", "seq"], axis=0, ascending=[True, True], inplace=True
+    )
+    return {
+        "Time": df_combined["Time"].values,
+        "Protocol": df_combined["Protocol"].values.astype(str),
+        "seq": df_combined["seq"].values,
+    }
+
+# Reruns on the same logs and script reuse the combined requests and retransmissions,
+# the script is an input, so edits of agoragym do not invalidate this pandas-only result
+cache = ResultCache(".cache")
+df_combined = pd.DataFrame(cache.get_or_compute(combine, {"step": "combine"},
+                                                inputs=[rexfer_log, request_log, __file__],
+                                                version=pd.__version__))
 df_combined.to_csv("req_and_rex.csv")
 
 class PacerQueue:
@@ -0,0 +1,162 @@
+import os
+import zipfile
+
+import numpy as np
+import pytest
+
+from agoragym.cache import ResultCache, stable_hash
+
+
+def _compute(calls):
+    def fn(config, seed):
+        calls.append((config["n"], seed))
+        return {"x": np.arange(config["n"], dtype=np.float64) + (seed or 0)}
+    return fn
+
+
+def test_sweep_reuses_cached_points(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    calls = []
+    first = cache.sweep(_compute(calls), [{"n": 3}, {"n": 4}], seeds=[0, 1])
+    second = cache.sweep(_compute(calls), [{"n": 3}, {"n": 4}, {"n": 5}], seeds=[0, 1])
+    assert calls == [(3, 0), (3, 1), (4, 0), (4, 1), (5, 0), (5, 1)]
+    np.testing.assert_array_equal(first[1][1]["x"], second[1][1]["x"])
+    np.testing.assert_array_equal(second[2][0]["x"], np.arange(5))
+    assert cache.hits == 4
+
+
+def test_single_array_result(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cache.key({"a": np.array([1.0, 2.0])}, seed=3)
+    cache.put(key, np.array([1, 2, 3]))
+    np.testing.assert_array_equal(cache.get(key), [1, 2, 3])
+
+
+def test_refuses_object_arrays(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    with pytest.raises(TypeError):
+        cache.put(cache.key({}), {"s": np.array(["a", None], dtype=object)})
+
+
+def _corrupt_empty(filename):
+    open(filename, "wb").close()
+
+
+def _corrupt_garbage(filename):
+    with open(filename, "wb") as f:
+        f.write(b"corrupt")
+
+
+def _corrupt_truncated(filename):
+    with open(filename, "rb") as f:
+        content = f.read()
+    with open(filename, "wb") as f:
+        f.write(content[:len(content) // 2])
+
+
+def _corrupt_deflate(filename):
+    # Keep the zip structure but damage the compressed bytes of the array
+    with zipfile.ZipFile(filename) as z:
+        info = z.infolist()[0]
+    with open(filename, "r+b") as f:
+        start = info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)
+        f.seek(start)
+        data = bytearray(f.read(info.compress_size))
+        for i in range(len(data)):
+            data[i] ^= 0xA5
+        f.seek(start)
+        f.write(data)
+
+
+@pytest.mark.parametrize("corrupt", [_corrupt_empty, _corrupt_garbage, _corrupt_truncated, _corrupt_deflate])
+def test_corrupt_entry_is_removed(tmp_path, corrupt):
+    cache = ResultCache(str(tmp_path))
+    calls = []
+    cache.get_or_compute(_compute(calls), {"n": 1000})
+    filename = cache._path(cache.key({"n": 1000}))
+    corrupt(filename)
+    assert cache.get(cache.key({"n": 1000})) is None
+    assert not os.path.exists(filename)
+    np.testing.assert_array_equal(cache.get_or_compute(_compute(calls), {"n": 1000})["x"], np.arange(1000))
+    assert len(calls) == 2
+
+
+def test_permission_error_is_raised(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    key = cache.key({})
+    cache.put(key, np.zeros(3))
+
+    def denied(*args, **kwargs):
+        raise PermissionError("denied")
+
+    monkeypatch.setattr(np, "load", denied)
+    with pytest.raises(PermissionError):
+        cache.get(key)
+    monkeypatch.undo()
+    assert os.path.exists(cache._path(key))
+
+
+def test_same_types_on_miss_and_hit(tmp_path):
+    cache = ResultCache(str(tmp_path))
+
+    def fn(config, seed):
+        return {"a": 1.5, "b": [1, 2]}
+
+    miss = cache.get_or_compute(fn, {})
+    hit = cache.get_or_compute(fn, {})
+    assert cache.hits == 1
+    for result in (miss, hit):
+        assert isinstance(result["a"], np.ndarray) and result["a"].shape == ()
+        assert isinstance(result["b"], np.ndarray)
+    single = cache.get_or_compute(lambda config, seed: [1, 2, 3], {"single": True})
+    assert isinstance(single, np.ndarray)
+
+
+def test_stable_hash_keeps_types():
+    assert stable_hash({"a": 1, "b": [1, 2]}) == stable_hash({"b": [1, 2], "a": 1})
+    assert stable_hash({1: 2}) != stable_hash({"1": 2})
+    assert stable_hash((1, 2)) != stable_hash([1, 2])
+    assert stable_hash({1, 2}) != stable_hash([1, 2])
+    assert stable_hash(True) != stable_hash(1)
+    assert stable_hash(np.float64(0.5)) == stable_hash(0.5)
+    # Mixed key types do not fail to sort
+    assert stable_hash({1: "a", "1": "b"}) == stable_hash({"1": "b", 1: "a"})
+    with pytest.raises(TypeError):
+        stable_hash({"f": object()})
+
+
+def test_keys_sharing_a_prefix_compute_concurrently(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    keys = {}
+    for i in range(10000):
+        prefix = cache.key({"i": i})[:2]
+        if prefix in keys:
+            pair = [keys[prefix], i]
+            break
+        keys[prefix] = i
+
+    def inner(config, seed):
+        return np.array([config["i"]])
+
+    def outer(config, seed):
+        # Computing another key of the same lock directory while this one is locked must not block
+        return cache.get_or_compute(inner, {"i": pair[1]}) + 1
+
+    assert cache.get_or_compute(outer, {"i": pair[0]})[0] == pair[1] + 1
+    # The lock files of computed keys are removed
+    assert [name for _, _, names in os.walk(cache.lock_dir) for name in names] == ["size.lock"]
+
+
+def test_evicts_least_recently_used(tmp_path):
+    rng = np.random.default_rng(0)
+    cache = ResultCache(str(tmp_path), max_bytes=20000)
+    keys = [cache.key({"i": i}) for i in range(20)]
+    for i, key in enumerate(keys):
+        cache.put(key, rng.random(500))
+        # Keep the first result recently used
+        assert cache.get(keys[0]) is not None
+    assert cache.size() <= 20000
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    # Lock files do not accumulate with the keys
+    assert [name for _, _, names in os.walk(cache.lock_dir) for name in names] == ["size.lock"]
@@ -0,0 +1,39 @@
+import pytest
+
+from agoragym.env.rare_event import importance_sampling, fixed_effort_splitting, mm1_overflow_probability
+
+ARRIVAL_RATE = 0.3
+SERVICE_RATE = 1.0
+
+
+def _within(result, exact, sigmas=4):
+    return abs(result.estimate - exact) <= sigmas * result.relative_error * result.estimate
+
+
+def test_fixed_effort_splitting():
+    exact = mm1_overflow_probability(ARRIVAL_RATE, SERVICE_RATE, 6)
+    result = fixed_effort_splitting(ARRIVAL_RATE, SERVICE_RATE, 6, effort=1000, seed=0)
+    assert result.estimate > 0
+    assert _within(result, exact)
+
+
+def test_importance_sampling():
+    exact = mm1_overflow_probability(ARRIVAL_RATE, SERVICE_RATE, 6)
+    result = importance_sampling(ARRIVAL_RATE, SERVICE_RATE, 6, cycles=1000, seed=0)
+    assert result.relative_error < 0.05
+    assert _within(result, exact)
+
+
+def test_importance_sampling_beats_brute_force():
+    exact = mm1_overflow_probability(ARRIVAL_RATE, SERVICE_RATE, 4)
+    tilted = importance_sampling(ARRIVAL_RATE, SERVICE_RATE, 4, cycles=1000, seed=1)
+    brute = importance_sampling(ARRIVAL_RATE, SERVICE_RATE, 4, cycles=3000, seed=1,
+                                tilted_arrival_rate=ARRIVAL_RATE, tilted_service_rate=SERVICE_RATE)
+    assert _within(tilted, exact)
+    # Events needed for a given relative error scale as relative_error^2 * events
+    assert tilted.relative_error ** 2 * tilted.events < 0.1 * brute.relative_error ** 2 * brute.events
+
+
+def test_importance_sampling_needs_two_cycles():
+    with pytest.raises(AssertionError):
+        importance_sampling(ARRIVAL_RATE, SERVICE_RATE, 4, cycles=1)
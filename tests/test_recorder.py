@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from gym import Env
+
+from agoragym.env.recorder import TrajectoryRecorder, TrajectoryDataset
+
+
+class _Sink(object):
+    def __init__(self):
+        self.waits = []
+
+
+class _StubEnv(Env):
+    '''
+    Resets itself at the end of an episode like CrissCrossEnv, replacing its sink.
+    '''
+
+    def __init__(self, elapse=3):
+        self.Mu = np.array([2.0, 1.2, 1.0])
+        self.elapse = elapse
+        self.episodes = 1
+        self.t = 0
+        self.sink1 = _Sink()
+
+    def step(self, action=None):
+        self.t += 1
+        self.sink1.waits.extend([float(self.t)] * self.t)
+        observation = {1: self.t, 2: 10 * self.t, 3: 100 * self.t}
+        reward = float(self.t)
+        done = self.t >= self.elapse
+        if done:
+            self.reset()
+        return observation, reward, done, {}
+
+    def reset(self):
+        self.episodes += 1
+        self.t = 0
+        self.sink1 = _Sink()
+        return {1: 0, 2: 0, 3: 0}
+
+    def close(self):
+        return 0
+
+
+def _record(directory, steps=7):
+    env = TrajectoryRecorder(_StubEnv(), str(directory), sinks=["sink1"], chunk_size=2, flush_every=1000)
+    for i in range(steps):
+        action = None if i % 2 else np.array([0.5, 0.4, 1.0])
+        env.step(action)
+    env.close()
+    return env
+
+
+def test_round_trip(tmp_path):
+    recorder = _record(tmp_path)
+    # The env episode counter is not shadowed by the recorder
+    assert recorder.episodes == 3
+
+    data = TrajectoryDataset(str(tmp_path))
+    assert len(data) == 7
+    assert data.obs_keys == [1, 2, 3]
+    assert data.num_episodes == 3
+    np.testing.assert_array_equal(data["episode_ends"], [3, 6, 7])
+
+    episode = data.episode(1)
+    np.testing.assert_array_equal(episode["observations"][:, 0], [1, 2, 3])
+    np.testing.assert_array_equal(episode["observations"][:, 2], [100, 200, 300])
+    np.testing.assert_array_equal(episode["rewards"], [1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(episode["dones"], [False, False, True])
+    assert np.isnan(data["actions"][1]).all()
+    np.testing.assert_array_equal(data["actions"][0], [0.5, 0.4, 1.0])
+
+    assert list(data.sink_waits("sink1", 0)) == [1.0]
+    assert list(data.sink_waits("sink1", 2)) == [3.0, 3.0, 3.0]
+    assert list(data.sink_waits("sink1", 4)) == [2.0, 2.0]
+    assert list(data.sink_waits("sink1", 6)) == [1.0]
+
+    batch = data.sample(64, np.random.default_rng(0))
+    assert batch["observations"].shape == (64, 3)
+    assert batch["actions"].shape == (64, 3)
+    t = batch["observations"][:, 0]
+    next_t = batch["next_observations"][:, 0]
+    np.testing.assert_array_equal(batch["rewards"], t)
+    # Transitions never cross an episode boundary, the last step of an episode is its own successor
+    assert np.all((next_t == t + 1) | (next_t == t))
+    np.testing.assert_array_equal(next_t[batch["dones"]], t[batch["dones"]])
+
+
+def test_refuses_existing_dataset(tmp_path):
+    _record(tmp_path)
+    with pytest.raises(FileExistsError):
+        TrajectoryRecorder(_StubEnv(), str(tmp_path), sinks=["sink1"])
+    assert len(TrajectoryDataset(str(tmp_path))) == 7